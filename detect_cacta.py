@@ -1,26 +1,76 @@
 import argparse
+import io
+import mmap
+import os
+import string
 import tempfile
 import time
-from typing import List, Tuple, IO
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Deque, Iterable, Iterator, List, Tuple, IO
 from typing_extensions import TypeAlias
 
-from Bio.Seq import Seq  # type: ignore
+import numpy as np
 from Bio.SeqIO.FastaIO import SimpleFastaParser  # type: ignore
 
-from utils import tir_information
 from parsing.detect_cacta import parse_arguments
 
 
-Candidate: TypeAlias = Tuple[str, str, int, int, int]
-Record: TypeAlias = Tuple[str, str]
-TirPair: TypeAlias = Tuple[int, int]
-PositionHash: TypeAlias = Tuple[int, int]
+Record: TypeAlias = Tuple[str, bytes]
+TirPairs: TypeAlias = Tuple[np.ndarray, np.ndarray]
+TirOccurrences: TypeAlias = Tuple[np.ndarray, np.ndarray]
+RecordTirs: TypeAlias = Tuple[TirPairs, TirPairs]
+SpooledRecord: TypeAlias = Tuple[int, str, int, int]
+Task: TypeAlias = Tuple[List[SpooledRecord], "Future[List[RecordTirs]]"]
 
 BASE_TO_NUM = {"A": 0, "C": 1, "G": 2, "T": 3}
-candidate_id = 1
 
+# Maps ASCII character to its base code (A: 0, C: 1, G: 2, T: 3), any other
+# character is mapped to 4.
+BASE_CODES = np.full(256, 4, dtype=np.uint8)
+BASE_CODES[[ord(base) for base in BASE_TO_NUM]] = list(BASE_TO_NUM.values())
 
-def hashTTT(tir: str, tsd: str, opening_tir: bool) -> int:
+# Base codes of searched TIRs.
+TIR_CODES = {tir: BASE_CODES[np.frombuffer(tir.encode("ascii"),
+                                           dtype=np.uint8)]
+             for tir in ("CACTA", "TAGTG", "CACTG", "CAGTG")}
+
+# Maps base code to code of complementary base, restricted code stays 4.
+COMPLEMENT_CODES = np.array([3, 2, 1, 0, 4], dtype=np.uint8)
+
+# Offsets of TIR remainder and TSD bases relative to the TIR position. For
+# closing TIR the remainder is read backwards, so it can be complemented into
+# reverse complement.
+OPENING_OFFSETS = np.array([5, 6, 7, 8, 9, -3, -2, -1])
+CLOSING_OFFSETS = np.array([-1, -2, -3, -4, -5, 5, 6, 7])
+RESTRICTED_CHARS_MASK = np.uint64(0x0404040404040404)
+# Shifts of base codes in hash, i.e. k-th base is multiplied by 4 ** k.
+HASH_SHIFTS = np.arange(0, 2 * len(OPENING_OFFSETS), 2, dtype=np.uint32)
+
+# Translation table converting ASCII lowercase letters to uppercase.
+UPPERCASE_TABLE = bytes.maketrans(string.ascii_lowercase.encode(),
+                                  string.ascii_uppercase.encode())
+# Size of sequence chunk converted to uppercase at once.
+UPPERCASE_CHUNK_SIZE = 1 << 24
+
+# Output files are written in chunks of records through large buffer.
+WRITE_BUFFER_SIZE = 1 << 20
+EXPORT_CHUNK_SIZE = 10000
+
+# Number of sequence positions scanned for TIR occurrences at once.
+SCAN_TILE_SIZE = 1 << 18
+
+# Number of low bits holding TIR position in key combining hash and position.
+POSITION_BITS = 40
+
+# Records detected in parallel are grouped into tasks of at least this many
+# bases, so that small scaffolds do not pay the overhead of task each.
+TASK_SIZE = 1 << 22
+
+
+def tir_tsd_hashes(codes: np.ndarray, tir_positions: np.ndarray,
+                   opening_tir: bool) -> Tuple[np.ndarray, np.ndarray]:
     """
     For two potential matching TIRs, instead of comparing whether each base of
     one TIR corresponds to reverse complement of another TIR, number encoding
@@ -31,321 +81,557 @@ def hashTTT(tir: str, tsd: str, opening_tir: bool) -> int:
     system. Each value at given position represents base at that position.
     A: 0, C: 1, G: 2, T: 3
     For closing pair, reverse complement of TIR and direct TSD is hashed, so
-    tir_tsd_hash("CACTA", "ATT", false) == tir_tsd_hash("TAGTG", "ATT", true)
+    hash of "CACTA" + "ATT" as closing TIR equals hash of "TAGTG" + "ATT" as
+    opening TIR.
 
     E.g. opening TIR "TAGCT" and corresponding TSD "TTC" is represented in
     quaternary numeral system as 13331203.
 
-    :param tir: TIR sequence
-    :param tsd: TSD sequence
+    Hashes of all TIRs are calculated at once.
+
+    :param codes: sequence encoded by encode_sequence
+    :param tir_positions: positions of TIRs in genome
     :param opening_tir: True if opening TIR, False otherwise
-    :return: TIR + TSD representation in quaternary numeral system
+    :return: TIR + TSD representations in quaternary numeral system and mask
+        of TIRs whose remainder and TSD contain only A, C, G, T bases
     """
+    offsets = OPENING_OFFSETS if opening_tir else CLOSING_OFFSETS
 
-    TTT_hash = 0
-    exponent = 0
+    bases = codes[tir_positions[:, None] + offsets[None, :]]
 
-    if not opening_tir:
-        tir = Seq(tir).reverse_complement()
+    # Do TIR remainder or TSD contain restricted chars? Only code 4 has the
+    # third bit set, so the eight codes are checked at once as single integer.
+    valid = (bases.view(np.uint64)[:, 0] & RESTRICTED_CHARS_MASK) == 0
 
-    for base in tir:
-        TTT_hash += BASE_TO_NUM[base] * (4 ** exponent)
-        exponent += 1
+    if not opening_tir:
+        bases[:, :5] = COMPLEMENT_CODES[bases[:, :5]]
 
-    for base in tsd:
-        TTT_hash += BASE_TO_NUM[base] * (4 ** exponent)
-        exponent += 1
+    hashes = (bases.astype(np.uint32) << HASH_SHIFTS).sum(axis=1,
+                                                          dtype=np.uint32)
 
-    return TTT_hash
+    return hashes, valid
 
 
-def tir_tsd_condensed(tir_position: int, genome_length: int,
-                      opening_tir: bool) -> bool:
+def tir_tsd_condensed(tir_positions: np.ndarray, genome_length: int,
+                      opening_tir: bool) -> np.ndarray:
     """
     Ensures that TIR and TSD are not too close to start or to end of genome.
-    :param tir_position: position of TIR in genome
+    :param tir_positions: positions of TIRs in genome
     :param genome_length: length of genome
     :param opening_tir:
-    :return:
+    :return: mask of TIRs too close to start or to end of genome
     """
-    return (opening_tir
-            and (tir_position < 3 or genome_length < tir_position + 10)) \
-        or (not opening_tir
-            and (genome_length < tir_position + 8 or tir_position < 5))
+    if opening_tir:
+        return (tir_positions < 3) | (genome_length < tir_positions + 10)
 
+    return (genome_length < tir_positions + 8) | (tir_positions < 5)
 
-def create_prefix_table(pattern: str) -> List[int]:
+
+def empty_positions() -> np.ndarray:
     """
-    Creates prefix table for Knuth-Morris-Pratt algorithm.
-    :param pattern: pattern to be searched for
-    :return: prefix table
+    Creates empty array of positions, used as default of Candidates arrays.
+    :return: empty array of positions
     """
-    pattern_length = len(pattern)
-    prefix_table = [0] * pattern_length
-    match_count = 0
+    return np.empty(0, dtype=np.int64)
 
-    for i in range(1, pattern_length):
-        while match_count > 0 and pattern[match_count] != pattern[i]:
-            match_count = prefix_table[match_count - 1]
 
-        if pattern[match_count] == pattern[i]:
-            match_count += 1
-            prefix_table[i] = match_count
+@dataclass
+class Candidates:
+    """
+    Detected candidates stored as separate arrays of their attributes. Arrays
+    are allocated with spare capacity, only first len(titles) items are valid.
+    Candidate sequences are not stored, they are sliced from the chromosome
+    sequence when exported.
+    """
+    titles: List[str] = field(default_factory=list)
+    starts: np.ndarray = field(default_factory=empty_positions)
+    ends: np.ndarray = field(default_factory=empty_positions)
+    seq_ids: np.ndarray = field(default_factory=empty_positions)
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def extend(self, titles: List[str], starts: np.ndarray, ends: np.ndarray,
+               seq_id: int) -> None:
+        """
+        Appends candidates detected in single sequence.
+        :param titles: candidate titles
+        :param starts: candidate start positions
+        :param ends: candidate end positions
+        :param seq_id: sequence identifier
+        """
+        count = len(self)
+        new_count = count + len(titles)
+
+        if len(self.starts) < new_count:
+            capacity = max(2 * len(self.starts), new_count)
+            self.starts = np.resize(self.starts, capacity)
+            self.ends = np.resize(self.ends, capacity)
+            self.seq_ids = np.resize(self.seq_ids, capacity)
+
+        self.titles.extend(titles)
+        self.starts[count:new_count] = starts
+        self.ends[count:new_count] = ends
+        self.seq_ids[count:new_count] = seq_id
+
+
+def read_records(handle: IO[str]) -> Iterator[Record]:
+    """
+    Reads FASTA records with sequences converted to ASCII bytes. Characters
+    out of ASCII are replaced, so positions in sequence are kept.
+    :param handle: FASTA file handle
+    :return: iterator over records
+    """
+    for title, sequence in SimpleFastaParser(handle):
+        yield title, sequence.encode("ascii", "replace")
 
-    return prefix_table
 
+def encode_sequence(sequence: bytes) -> np.ndarray:
+    """
+    Encodes nucleotide sequence into array of base codes.
+    A: 0, C: 1, G: 2, T: 3, any other character: 4
+    :param sequence: nucleotide sequence
+    :return: array of base codes
+    """
+    return BASE_CODES[np.frombuffer(sequence, dtype=np.uint8)]
 
-def find_all_tirs(tir: str, sequence: str,
-                  opening_tir: bool) -> List[PositionHash]:
+
+def find_all_tirs(tir: str, codes: np.ndarray,
+                  opening_tir: bool) -> TirOccurrences:
     """
-    Employs Knuth-Morris-Pratt algorithm to find all occurrences of TIR in
-    genome.
+    Finds all occurrences of TIR in genome.
+    Instead of scanning the sequence base by base, each base of the TIR is
+    compared with the whole shifted sequence tile at once and the comparisons
+    are combined into mask of TIR occurrences.
     The search:
         - expects input sequence to contain exclusively uppercase characters
         - does not support entire IUPAC nucleotide code when looking for TIR
             and TSD, i.e. can only contain: A, C, G, T characters.
 
     :param tir: TIR to be searched for
-    :param sequence: nucleotide sequence to be searched in
+    :param codes: nucleotide sequence encoded by encode_sequence
     :param opening_tir: True if the TIR is opening (at the 5' end),
         False otherwise
-    :return: List containing for each occurrence its position in genome
-        along with hash value of TIR remainder with corresponding TSD
+    :return: positions of occurrences in genome (in ascending order) along
+        with hash values of TIR remainder with corresponding TSD
     """
-    sequence_length = len(sequence)
-    tir_length = len(tir)
-    occurrences: List[PositionHash] = []
-
-    if tir_length == 0:
-        return occurrences
-
-    prefix_table = create_prefix_table(tir)
-
-    j = 0
-
-    for i in range(sequence_length):
-        while j > 0 and sequence[i] != tir[j]:
-            j = prefix_table[j - 1]
+    sequence_length = len(codes)
+    tir_codes = TIR_CODES.get(tir)
+    if tir_codes is None:
+        tir_codes = encode_sequence(tir.encode("ascii"))
+    tir_length = len(tir_codes)
 
-        if sequence[i] != tir[j]:
-            continue
+    if tir_length == 0 or sequence_length < tir_length:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint32)
 
-        j += 1
+    # Sequence is scanned in tiles small enough to keep the temporary masks
+    # in cache, the masks are reused by all tiles.
+    window_count = sequence_length - tir_length + 1
+    mask = np.empty(min(window_count, SCAN_TILE_SIZE), dtype=bool)
+    base_mask = np.empty_like(mask)
+    tile_positions = []
 
-        if j != tir_length:
-            continue
+    for tile_start in range(0, window_count, SCAN_TILE_SIZE):
+        tile_size = min(window_count - tile_start, SCAN_TILE_SIZE)
+        tile_mask = mask[:tile_size]
+        tile_base_mask = base_mask[:tile_size]
 
-        j = prefix_table[j - 1]
-        tir_position = i - tir_length + 1
+        np.equal(codes[tile_start:tile_start + tile_size], tir_codes[0],
+                 out=tile_mask)
 
-        if tir_tsd_condensed(tir_position, sequence_length, opening_tir):
-            continue
+        for i in range(1, tir_length):
+            np.equal(codes[tile_start + i:tile_start + i + tile_size],
+                     tir_codes[i], out=tile_base_mask)
+            np.logical_and(tile_mask, tile_base_mask, out=tile_mask)
 
-        if opening_tir:
-            tir_remainder = sequence[tir_position + 5: tir_position + 10]
-            tsd = sequence[tir_position - 3: tir_position]
-        else:
-            tir_remainder = sequence[tir_position - 5: tir_position]
-            tsd = sequence[tir_position + 5: tir_position + 8]
+        tile_positions.append(tile_start + np.flatnonzero(tile_mask))
 
-        # Do TIR remainder or TSD contain restricted chars?
-        if set(tir_remainder + tsd) - {"A", "C", "G", "T"} != set():
-            continue
+    tir_positions = np.concatenate(tile_positions)
+    tir_positions = tir_positions[
+        ~tir_tsd_condensed(tir_positions, sequence_length, opening_tir)]
 
-        hash_code = hashTTT(tir_remainder, tsd, opening_tir)
+    hashes, valid = tir_tsd_hashes(codes, tir_positions, opening_tir)
 
-        occurrences.append((tir_position, hash_code))
+    return tir_positions[valid], hashes[valid]
 
-    return occurrences
 
-
-# For opening_tirs[i] at position X in genome, there are N closing
-# TIRs at lower position than X. For opening_tirs[i+1] we can certainly
-# skip at least first N closing TIRs.
-def filter_matching_tirs(opening_tirs: List[PositionHash],
-                         closing_tirs: List[PositionHash],
-                         min_length: int, max_length: int) -> List[TirPair]:
+# Closing TIRs are sorted by key combining hash and position, so closing TIRs
+# matching given opening TIR form a continuous range of the sorted keys, which
+# can be bounded by binary search.
+def filter_matching_tirs(opening_tirs: TirOccurrences,
+                         closing_tirs: TirOccurrences,
+                         min_length: int, max_length: int) -> TirPairs:
     """
     Finds all matching TIR pairs (opening with closing) based on the TIR and
     TSD sequences, as well as their relative position in genome.
-    :param opening_tirs: list of position opening TIRs (position and hash)
-    :param closing_tirs: list of position closing TIRs (position and hash)
+    :param opening_tirs: opening TIRs (positions and hashes)
+    :param closing_tirs: closing TIRs (positions and hashes)
     :param min_length: minimum TE length
     :param max_length: maximum TE length
-    :return: list of closing and opening TIR pair positions
+    :return: opening and closing positions of TIR pairs
     """
-    smallest_relevant_closing_tir = 0
-    matching_tirs = []
-    closing_tirs_len = len(closing_tirs)
+    opening_positions, opening_hashes = opening_tirs
+    closing_positions, closing_hashes = closing_tirs
 
-    for opening_tir in opening_tirs:
-        opening_position, opening_hash = opening_tir[0], opening_tir[1]
-        for i in range(smallest_relevant_closing_tir, closing_tirs_len):
-            closing_position, closing_hash = closing_tirs[i][0], \
-                closing_tirs[i][1]
+    opening_keys = (opening_hashes.astype(np.int64) << POSITION_BITS) \
+        | opening_positions
+    closing_keys = np.sort((closing_hashes.astype(np.int64) << POSITION_BITS)
+                           | closing_positions)
 
-            if opening_position + max_length < closing_position:
-                break
+    lower = np.searchsorted(closing_keys, opening_keys + min_length - 4,
+                            side="left")
+    upper = np.searchsorted(closing_keys, opening_keys + max_length,
+                            side="right")
+    counts = np.maximum(upper - lower, 0)
 
-            if closing_position + 4 < opening_position + min_length:
-                smallest_relevant_closing_tir += 1
-                continue
+    # Index of each matching closing TIR in closing_keys, ordered by opening
+    # TIR and then by closing TIR position.
+    group_starts = np.repeat(lower - np.cumsum(counts) + counts, counts)
+    closing_indices = group_starts + np.arange(counts.sum())
 
-            if opening_hash == closing_hash:
-                matching_tirs.append((opening_position, closing_position))
+    matching_openings = np.repeat(opening_positions, counts)
+    matching_closings = closing_keys[closing_indices] \
+        & ((1 << POSITION_BITS) - 1)
 
-    return matching_tirs
+    return matching_openings, matching_closings
 
 
-def retrieve_candidates(record: Record, matching_tirs: List[TirPair],
-                        tir_info: bool, elements: List[Candidate],
+def retrieve_candidates(record: Record, matching_tirs: TirPairs,
+                        tir_info: bool, elements: Candidates,
                         seq_id: int) -> None:
     """
-    Retrieves candidate sequences based on the matching TIR pairs.
+    Retrieves candidates based on the matching TIR pairs.
     :param record: record, most probably chromosome sequence
-    :param matching_tirs: list of matching TIR pairs
+    :param matching_tirs: opening and closing positions of TIR pairs
     :param tir_info: whether to include TIR information
-    :param elements: list of detected candidates
+    :param elements: detected candidates
     :param seq_id: sequence identifier
     :return:
     """
-    global candidate_id
-
     record_title = record[0]
     record_seq = record[1]
+    openings, closings = matching_tirs
+    ends = closings + 5
+    titles = [f"{record_title}_CACTA{len(elements) + i}"
+              for i in range(1, len(openings) + 1)]
 
-    for (opening, closing) in matching_tirs:
-        title = f"{record_title}_CACTA{candidate_id}"
-        sequence = record_seq[opening:closing + 5]
+    if tir_info:
+        # Imported only when needed, as it loads Numba.
+        from utils import tir_information
 
-        if tir_info:
-            title, sequence = tir_information.extract_tir_info(
-                (title, sequence), tir_information.default_aligner())
+        # TIRs of all candidates are gathered and aligned in one batch.
+        matrices = tir_information.tir_matrices_at(record_seq, openings, ends)
+        counts = tir_information.align_tirs(
+            matrices, tir_information.default_aligner()).tolist()
+        titles = [tir_information.tir_title(title, *title_counts)
+                  for title, title_counts in zip(titles, counts)]
 
-        elements.append((title, sequence, opening, closing + 5, seq_id))
-        candidate_id += 1
+    elements.extend(titles, openings, ends, seq_id)
 
 
-def detect_cacta(record: Record, args: argparse.Namespace,
-                 elements: List[Candidate], seq_id: int) -> None:
+def detect_cacta(codes: np.ndarray, args: argparse.Namespace) -> TirPairs:
     """
-    Detects CACTA TE candidates in input DNA sequence.
-    :param record: chromosome record
+    Detects CACTA-TAGTG matching TIR pairs in input DNA sequence.
+    :param codes: chromosome sequence encoded by encode_sequence
     :param args: parsed command line arguments
-    :param elements: list of detected candidates
-    :param seq_id: sequence identifier
-    :return:
+    :return: opening and closing positions of TIR pairs
     """
-    print(f"Getting opening CACTA TIRs.")
-    cacta_tirs = find_all_tirs("CACTA", record[1], True)
+    cacta_tirs = find_all_tirs("CACTA", codes, True)
+    tagtg_tirs = find_all_tirs("TAGTG", codes, False)
+
+    return filter_matching_tirs(cacta_tirs, tagtg_tirs,
+                                args.min_len, args.max_len)
 
-    print(f"Getting closing TAGTG TIRs.")
-    tagtg_tirs = find_all_tirs("TAGTG", record[1], False)
 
-    matching_tirs = filter_matching_tirs(cacta_tirs, tagtg_tirs,
-                                         args.min_len, args.max_len)
+def detect_cactg(codes: np.ndarray, args: argparse.Namespace) -> TirPairs:
+    """
+    Detects CACTG-CAGTG matching TIR pairs in input DNA sequence.
+    :param codes: chromosome sequence encoded by encode_sequence
+    :param args: parsed command line arguments
+    :return: opening and closing positions of TIR pairs
+    """
+    cactg_tirs = find_all_tirs("CACTG", codes, True)
+    cagtg_tirs = find_all_tirs("CAGTG", codes, False)
 
-    retrieve_candidates(record, matching_tirs, args.tir_info, elements, seq_id)
+    return filter_matching_tirs(cactg_tirs, cagtg_tirs,
+                                args.min_len, args.max_len)
 
 
-def detect_cactg(record: Record, args: argparse.Namespace,
-                 elements: List[Candidate], seq_id: int) -> None:
+def detect_record_tirs(sequence: bytes,
+                       args: argparse.Namespace) -> RecordTirs:
     """
-    Detects CACTG TE candidates in input DNA sequence.
-    :param record: chromosome record
+    Detects both CACTA-TAGTG and CACTG-CAGTG matching TIR pairs in input DNA
+    sequence.
+    :param sequence: chromosome sequence
     :param args: parsed command line arguments
-    :param elements: list of detected candidates
+    :return: CACTA-TAGTG and CACTG-CAGTG TIR pairs
+    """
+    codes = encode_sequence(sequence)
+
+    return detect_cacta(codes, args), detect_cactg(codes, args)
+
+
+def detect_spooled_tirs(spool_name: str, ranges: List[Tuple[int, int]],
+                        args: argparse.Namespace) -> List[RecordTirs]:
+    """
+    Detects matching TIR pairs in sequences stored in spool file. Sequences
+    are memory mapped, so they are not copied into the worker process.
+    Runs in worker process.
+    :param spool_name: name of spool file with the sequences
+    :param ranges: offsets and lengths of the sequences in the spool file
+    :param args: parsed command line arguments
+    :return: CACTA-TAGTG and CACTG-CAGTG TIR pairs of every sequence
+    """
+    return [detect_record_tirs(np.memmap(spool_name, dtype=np.uint8,
+                                         mode="r", offset=offset,
+                                         shape=(length,))
+                               if length else b"", args)
+            for offset, length in ranges]
+
+
+def add_record_candidates(record: Record, record_tirs: RecordTirs,
+                          tir_info: bool, candidates: Candidates,
+                          seq_id: int) -> None:
+    """
+    Adds candidates delimited by matching TIR pairs of one record.
+    :param record: chromosome record
+    :param record_tirs: CACTA-TAGTG and CACTG-CAGTG TIR pairs
+    :param tir_info: whether to include TIR information
+    :param candidates: detected candidates
     :param seq_id: sequence identifier
     """
-    print(f"Getting opening CACTG TIRs.")
-    cactg_tirs = find_all_tirs("CACTG", record[1], True)
+    cacta_tirs, cactg_tirs = record_tirs
+    count_before = len(candidates)
 
-    print(f"Getting closing CAGTG TIRs.")
-    cagtg_tirs = find_all_tirs("CAGTG", record[1], False)
+    retrieve_candidates(record, cacta_tirs, tir_info, candidates, seq_id)
+    cacta_count = len(candidates) - count_before
 
-    matching_tirs = filter_matching_tirs(cactg_tirs, cagtg_tirs,
-                                         args.min_len, args.max_len)
+    retrieve_candidates(record, cactg_tirs, tir_info, candidates, seq_id)
+    cactg_count = len(candidates) - count_before - cacta_count
 
-    retrieve_candidates(record, matching_tirs, args.tir_info, elements, seq_id)
+    print(f"Found {cacta_count} CACTA-TAGTG and "
+          f"{cactg_count} CACTG-CAGTG matching TIRs in {record[0]}.\n")
 
 
-def detect_all_candidates(temp_handle: IO[str],
-                          args: argparse.Namespace) -> List[Candidate]:
+def submit_task(executor: ProcessPoolExecutor, spool: IO[bytes],
+                records: List[SpooledRecord],
+                args: argparse.Namespace) -> Task:
     """
-    Detects CACTA TE candidates (both CACTA and CACTG) in input DNA sequence.
-    :param temp_handle: temporary file handle
+    Submits detection of matching TIR pairs of spooled records to worker
+    process.
+    :param executor: pool of worker processes
+    :param spool: spool file with the record sequences
+    :param records: sequence identifiers, titles, offsets and lengths of
+        records in the spool file
     :param args: parsed command line arguments
-    :return: list of detected CACTA TE candidates
+    :return: the records and the detection result
     """
-    candidates: List[Candidate] = []
+    spool.flush()
+    future = executor.submit(detect_spooled_tirs, spool.name,
+                             [(offset, length)
+                              for _, _, offset, length in records], args)
 
-    for seq_id, record in enumerate(SimpleFastaParser(temp_handle), 1):
-        print(f"Processing '{record[0]}' sequence.")
+    return records, future
 
-        count_before = len(candidates)
 
-        detect_cacta(record, args, candidates, seq_id)
-        cacta_count = len(candidates) - count_before
+def collect_task(task: Task, spool: IO[bytes], args: argparse.Namespace,
+                 candidates: Candidates) -> None:
+    """
+    Waits for matching TIR pairs detected in worker process and adds the
+    candidates of its records.
+    :param task: task submitted by submit_task
+    :param spool: spool file with the record sequences
+    :param args: parsed command line arguments
+    :param candidates: detected candidates
+    """
+    records, future = task
 
-        detect_cactg(record, args, candidates, seq_id)
-        cactg_count = len(candidates) - count_before - cacta_count
+    for (seq_id, title, offset, length), record_tirs \
+            in zip(records, future.result()):
+        # Sequence itself is needed only to retrieve TIR information.
+        sequence = b""
 
-        print(f"Found {cacta_count} CACTA-TAGTG and "
-              f"{cactg_count} CACTG-CAGTG matching TIRs in {record[0]}.\n")
+        if args.tir_info:
+            spool.seek(offset)
+            sequence = spool.read(length)
 
-    print(f"\nOverall, {candidate_id - 1} CACTA candidates were detected.\n")
+        add_record_candidates((title, sequence), record_tirs, args.tir_info,
+                              candidates, seq_id)
 
-    return candidates
+
+def detect_in_parallel(records: Iterable[Record], args: argparse.Namespace,
+                       candidates: Candidates) -> None:
+    """
+    Detects candidates of records in parallel processes. Sequences are
+    written to spool file on disk, so that workers read only their records.
+    Small records are grouped into one task. Candidates are added in order of
+    records.
+    :param records: chromosome records
+    :param args: parsed command line arguments
+    :param candidates: detected candidates
+    """
+    pending: Deque[Task] = deque()
+    batch: List[SpooledRecord] = []
+    batch_size = 0
+
+    # Spool file is reopened by workers, so it must not be deleted on close,
+    # which would prevent reopening on Windows.
+    with tempfile.NamedTemporaryFile(delete=False) as spool:
+        try:
+            with ProcessPoolExecutor(max_workers=args.processes) as executor:
+                for seq_id, (title, sequence) in enumerate(records, 1):
+                    print(f"Processing '{title}' sequence.")
+                    spool.seek(0, os.SEEK_END)
+                    batch.append((seq_id, title, spool.tell(), len(sequence)))
+                    spool.write(sequence)
+                    batch_size += len(sequence)
+
+                    if batch_size < TASK_SIZE:
+                        continue
+
+                    pending.append(submit_task(executor, spool, batch, args))
+                    batch = []
+                    batch_size = 0
+
+                    # Keep only as many tasks pending as there are workers.
+                    while len(pending) > args.processes:
+                        collect_task(pending.popleft(), spool, args,
+                                     candidates)
+
+                if batch:
+                    pending.append(submit_task(executor, spool, batch, args))
+
+                while pending:
+                    collect_task(pending.popleft(), spool, args, candidates)
+        finally:
+            spool.close()
+            os.remove(spool.name)
 
 
-def file_to_uppercase_temp(temp_handle: IO[str], in_file_name: str) -> None:
+def detect_all_candidates(temp_handle: IO[str],
+                          args: argparse.Namespace) -> Candidates:
     """
-    Converts input file to uppercase and writes it to temporary file.
+    Detects CACTA TE candidates (both CACTA and CACTG) in input DNA sequence.
     :param temp_handle: temporary file handle
+    :param args: parsed command line arguments
+    :return: detected CACTA TE candidates
+    """
+    candidates = Candidates()
+    records = read_records(temp_handle)
+
+    if args.processes > 1:
+        detect_in_parallel(records, args, candidates)
+    else:
+        for seq_id, record in enumerate(records, 1):
+            print(f"Processing '{record[0]}' sequence.")
+            add_record_candidates(record, detect_record_tirs(record[1], args),
+                                  args.tir_info, candidates, seq_id)
+
+    print(f"\nOverall, {len(candidates)} CACTA candidates were detected.\n")
+
+    return candidates
+
+
+def file_to_uppercase_temp(temp_handle: IO[bytes], in_file_name: str) -> None:
+    """
+    Converts sequences of input file to uppercase and writes them to
+    temporary file. Header lines are copied unchanged.
+    :param temp_handle: temporary file handle opened in binary mode
     :param in_file_name: name of input file
     """
-    with open(in_file_name, "r") as in_file_handle:
-        for record in SimpleFastaParser(in_file_handle):
-            temp_handle.write(f">{record[0]}\n{record[1].upper()}\n")
+    with open(in_file_name, "rb") as in_file_handle:
+        if os.fstat(in_file_handle.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(in_file_handle.fileno(), 0,
+                       access=mmap.ACCESS_READ) as in_file:
+            file_size = len(in_file)
+            position = 0
+
+            while position < file_size:
+                # Header line or sequence lines up to the next header, the
+                # last one reaches the end of file.
+                if in_file[position] == ord(">"):
+                    end = in_file.find(b"\n", position) + 1 or file_size
+                    temp_handle.write(in_file[position:end])
+                    position = end
+                    continue
+
+                end = in_file.find(b"\n>", position) + 1 or file_size
+
+                for chunk_start in range(position, end,
+                                         UPPERCASE_CHUNK_SIZE):
+                    chunk_end = min(chunk_start + UPPERCASE_CHUNK_SIZE, end)
+                    temp_handle.write(in_file[chunk_start:chunk_end]
+                                      .translate(UPPERCASE_TABLE))
+
+                position = end
+
     temp_handle.seek(0)
 
 
-def export_fasta(candidates: List[Candidate], out_file: str) -> None:
+def export_fasta(candidates: Candidates, records: Iterable[Record],
+                 out_file: str) -> None:
     """
     Exports candidate sequences in FASTA format.
-    :param candidates: candidate sequences
+    :param candidates: detected candidates
+    :param records: records the candidates were detected in
     :param out_file: output file name
     """
     print("\nExporting transposon sequences in FASTA format.")
 
-    with open(out_file, "w") as handle:
-        for candidate in candidates:
-            handle.write(f">{candidate[0]}\n{candidate[1]}\n")
+    seq_ids = candidates.seq_ids[:len(candidates)]
+
+    with open(out_file, "wb", buffering=WRITE_BUFFER_SIZE) as handle:
+        for seq_id, record in enumerate(records, 1):
+            if len(seq_ids) == 0 or seq_ids[-1] < seq_id:
+                break
+
+            # Candidates are ordered by sequence identifier.
+            first = int(np.searchsorted(seq_ids, seq_id, side="left"))
+            last = int(np.searchsorted(seq_ids, seq_id, side="right"))
+
+            for i in range(first, last, EXPORT_CHUNK_SIZE):
+                chunk = range(i, min(i + EXPORT_CHUNK_SIZE, last))
+                handle.write(b"".join(
+                    b">%s\n%s\n" % (
+                        candidates.titles[j].encode(),
+                        record[1][candidates.starts[j]:candidates.ends[j]])
+                    for j in chunk))
 
     print(f"Transposon sequences are stored in '{out_file}'")
 
 
-def export_gff3(candidates: List[Candidate], out_file: str) -> None:
+def export_gff3(candidates: Candidates, out_file: str) -> None:
     """
     Exports candidates annotation in GFF3 format.
-    :param candidates: candidate sequences
+    :param candidates: detected candidates
     :param out_file: output file name
     """
     print("\nExporting transposon annotation in GFF3 format.")
 
-    with open(out_file, "w") as handle:
+    count = len(candidates)
+    annotation = list(zip(candidates.titles,
+                          candidates.starts[:count].tolist(),
+                          candidates.ends[:count].tolist(),
+                          candidates.seq_ids[:count].tolist()))
+
+    with open(out_file, "w", buffering=WRITE_BUFFER_SIZE) as handle:
         handle.write("##gff-version 3\n")
 
-        for title, seq, start, end, seq_id in candidates:
-            handle.write(f"{seq_id}\t"
-                         f"detect_cacta.py\t"
-                         f"CACTA_TIR_transposon\t"
-                         f"{start}\t"
-                         f"{end}\t"
-                         f".\t"
-                         f"+\t"
-                         f".\t"
-                         f"SeqName={title};\n")
+        for i in range(0, count, EXPORT_CHUNK_SIZE):
+            handle.write("".join(
+                f"{seq_id}\t"
+                f"detect_cacta.py\t"
+                f"CACTA_TIR_transposon\t"
+                f"{start}\t"
+                f"{end}\t"
+                f".\t"
+                f"+\t"
+                f".\t"
+                f"SeqName={title};\n"
+                for title, start, end, seq_id
+                in annotation[i:i + EXPORT_CHUNK_SIZE]))
 
     print(f"Transposon sequences are stored in '{out_file}'")
 
@@ -354,12 +640,16 @@ def main() -> None:
     start_time = time.time()
     args = parse_arguments()
 
-    with tempfile.TemporaryFile(mode="r+") as temp_handle:
+    with tempfile.TemporaryFile() as temp_handle:
         file_to_uppercase_temp(temp_handle, args.in_file)
-        candidates = detect_all_candidates(temp_handle, args)
+        text_handle = io.TextIOWrapper(temp_handle)
+        candidates = detect_all_candidates(text_handle, args)
+
+        if args.fasta_out:
+            text_handle.seek(0)
+            export_fasta(candidates, read_records(text_handle),
+                         args.fasta_out)
 
-    if args.fasta_out:
-        export_fasta(candidates, args.fasta_out)
     if args.gff3:
         export_gff3(candidates, args.gff3)
 
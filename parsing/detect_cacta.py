@@ -1,4 +1,5 @@
 import argparse
+import sys
 
 from parsing import parsing_utils
 
@@ -8,6 +9,9 @@ This module contains functions for parsing command line
 arguments for the detect_cacta.py script.
 """
 
+# ProcessPoolExecutor accepts at most 61 worker processes on Windows.
+MAX_PROCESSES = 61 if sys.platform == "win32" else 1024
+
 
 def validate_min_length(arg: str) -> int:
     return parsing_utils.validate_arg_bounds(arg, 50, 23018)
@@ -17,6 +21,10 @@ def validate_max_length(arg: str) -> int:
     return parsing_utils.validate_arg_bounds(arg, 50, 30000)
 
 
+def validate_processes(arg: str) -> int:
+    return parsing_utils.validate_arg_bounds(arg, 1, MAX_PROCESSES)
+
+
 def parse_arguments() -> argparse.Namespace:
     """
     Parse command line arguments for detect_cacta.py script.
@@ -60,6 +68,13 @@ def parse_arguments() -> argparse.Namespace:
                              "gap count) to candidate name")
     parser.set_defaults(tir_info=False)
 
+    parser.add_argument("-p",
+                        "--processes",
+                        type=validate_processes,
+                        default=1,
+                        help="Number of processes detecting candidates in "
+                             "parallel sequences")
+
     args = parser.parse_args()
 
     if args.fasta_out is None and args.gff3 is None:
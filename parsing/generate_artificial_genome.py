@@ -64,4 +64,8 @@ def parse_arguments() -> argparse.Namespace:
                              " to file not overfilling memory",
                         required=True)
 
+    parser.add_argument("--seed",
+                        type=int,
+                        help="Seed of the random number generator")
+
     return parser.parse_args()
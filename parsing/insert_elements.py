@@ -30,4 +30,8 @@ def parse_arguments() -> argparse.Namespace:
                         help="The output directory path.",
                         required=True)
 
+    parser.add_argument("--seed",
+                        type=int,
+                        help="Seed of the random number generator.")
+
     return parser.parse_args()
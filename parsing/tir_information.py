@@ -1,5 +1,11 @@
 import argparse
 
+from parsing import parsing_utils
+
+
+def validate_tir_length(arg: str) -> int:
+    return parsing_utils.validate_arg_bounds(arg, 1, 1000)
+
 
 def parse_arguments() -> argparse.Namespace:
     """
@@ -27,7 +33,7 @@ def parse_arguments() -> argparse.Namespace:
 
     parser.add_argument("-t",
                         "--tir-length",
-                        type=int,
+                        type=validate_tir_length,
                         default=28,
                         help="TIR length to be aligned")
 
@@ -1,10 +1,15 @@
+from typing import Optional
+
 import numpy as np
 
 from parsing.generate_artificial_genome import parse_arguments
 
+WRITE_BUFFER_SIZE = 1 << 20
+
 
 def generate_artificial_sequence(size: int, chromosomes: int, gc_content: int,
-                                 chunk_size: int, out_file: str) -> None:
+                                 chunk_size: int, out_file: str,
+                                 seed: Optional[int] = None) -> None:
     """
     Generate artificial genomic sequence with specified size, number of
     chromosomes and GC content.
@@ -13,8 +18,10 @@ def generate_artificial_sequence(size: int, chromosomes: int, gc_content: int,
     :param gc_content: GC content of the genome
     :param chunk_size: chunk size to write to file iteratively
     :param out_file: file to write the sequence into
+    :param seed: seed of the random number generator
     """
-    nts = ["A", "C", "G", "T"]
+    nts = np.frombuffer(b"ACGT", dtype=np.uint8)
+    rng = np.random.default_rng(seed)
     at_content = 100 - gc_content
     a_probability = t_probability = at_content / 200
     c_probability = g_probability = gc_content / 200
@@ -33,28 +40,23 @@ def generate_artificial_sequence(size: int, chromosomes: int, gc_content: int,
     else:
         str_size = f"{round(size / 1000000000, 2)}Gb"
 
-    with open(out_file, "w"):
-        pass
-
-    for i in range(1, chromosomes + 1):
-        chromosome_size = size // chromosomes
-        print(f"Generating chromosome {i} of {chromosomes}"
-              f" ({chromosome_size}bp)")
-
-        with open(out_file, "a") as handle:
-            handle.write(f">randomGenome_{str_size}_{gc_content}GC_ch{i}\n")
+    with open(out_file, "wb", buffering=WRITE_BUFFER_SIZE) as handle:
+        for i in range(1, chromosomes + 1):
+            chromosome_size = size // chromosomes
+            print(f"Generating chromosome {i} of {chromosomes}"
+                  f" ({chromosome_size}bp)")
 
-        while chromosome_size > 0:
-            ch = min(chromosome_size, chunk_size)
-            chromosome_size -= ch
+            handle.write(f">randomGenome_{str_size}_{gc_content}GC_ch{i}\n"
+                         .encode())
 
-            sequence = "".join(np.random.choice(nts, size=ch, p=probabilities))
+            while chromosome_size > 0:
+                ch = min(chromosome_size, chunk_size)
+                chromosome_size -= ch
 
-            with open(out_file, "a") as handle:
-                handle.write(f"{sequence}")
+                handle.write(nts[rng.choice(4, size=ch, p=probabilities)]
+                             .tobytes())
 
-        with open(out_file, "a") as handle:
-            handle.write("\n")
+            handle.write(b"\n")
 
     print(f"Genomic sequence has been written to '{out_file}'")
 
@@ -64,7 +66,7 @@ def main() -> None:
 
     generate_artificial_sequence(args.size, args.num_of_chromosomes,
                                  args.gc_content, args.chunk_size,
-                                 args.out_file)
+                                 args.out_file, args.seed)
 
 
 if __name__ == '__main__':
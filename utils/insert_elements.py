@@ -1,8 +1,12 @@
 from parsing.insert_elements import parse_arguments
-import random
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
+import numpy as np
 from Bio.SeqIO.FastaIO import SimpleFastaParser  # type: ignore
 
+NUCLEOTIDES = np.frombuffer(b"ACGT", dtype=np.uint8)
+TSD_LENGTH = 3
+WRITE_BUFFER_SIZE = 1 << 20
+
 
 def read_genome(file_path: str) -> List[Tuple[str, str]]:
     """
@@ -30,7 +34,7 @@ def write_genome(file_path: str, genome: List[Tuple[str, str]]) -> None:
     :param file_path: path to output file
     :param genome: list of chromosome records
     """
-    with open(file_path, "w") as handle:
+    with open(file_path, "w", buffering=WRITE_BUFFER_SIZE) as handle:
         for (ch_title, ch_seq) in genome:
             handle.write(f">{ch_title}\n{ch_seq}\n")
 
@@ -44,14 +48,11 @@ def write_inserted_sequences(file_path: str, genome: List[Tuple[str, str]],
     :param genome: list of chromosome records
     :param positions: positions of inserted elements
     """
-    with open(file_path, "w"):
-        pass
-
-    with open(file_path, "a") as handle:
+    with open(file_path, "w", buffering=WRITE_BUFFER_SIZE) as handle:
         for (i, (ch_title, ch_seq)) in enumerate(genome):
-            handle.writelines(f">{title}, {start}-{end}\n"
-                              f"{ch_seq[start:end]}\n"
-                              for (title, start, end) in positions[i])
+            handle.write("".join(f">{title}, {start}-{end}\n"
+                                 f"{ch_seq[start:end]}\n"
+                                 for (title, start, end) in positions[i]))
 
 
 def write_gff3(file_path: str, genome: List[Tuple[str, str]],
@@ -62,62 +63,115 @@ def write_gff3(file_path: str, genome: List[Tuple[str, str]],
     :param genome: list of chromosome records
     :param positions: positions of inserted elements
     """
-    with open(file_path, "w") as handle:
+    with open(file_path, "w", buffering=WRITE_BUFFER_SIZE) as handle:
         handle.write("##gff-version 3\n")
 
-    with open(file_path, "a") as handle:
         for (i, _) in enumerate(genome):
-            for (title, start, end) in positions[i]:
-                handle.write(f"{i + 1}\tinsert_cacta.py\tCACTA_TIR_transposon"
-                             f"\t{start}\t{end}\t.\t+\t.\tSeqName={title}\n")
+            handle.write("".join(
+                f"{i + 1}\tinsert_cacta.py\tCACTA_TIR_transposon"
+                f"\t{start}\t{end}\t.\t+\t.\tSeqName={title}\n"
+                for (title, start, end) in positions[i]))
+
+
+def insert_segment(segments: List[str], segment_ends: np.ndarray,
+                   position: int, sequence: str) -> np.ndarray:
+    """
+    Insert sequence into chromosome represented by list of its segments.
+    Only the segment containing the position is split, so the chromosome
+    sequence is not copied on each insertion.
+    :param segments: chromosome segments, updated in place
+    :param segment_ends: end positions of segments within chromosome
+    :param position: position to insert the sequence at
+    :param sequence: sequence to be inserted
+    :return: end positions of updated segments
+    """
+    i = int(np.searchsorted(segment_ends, position, side="right"))
+    segment_start = int(segment_ends[i - 1]) if i > 0 else 0
+    split = position - segment_start
+
+    pieces = [piece for piece in (segments[i][:split], sequence,
+                                  segments[i][split:]) if piece]
+    piece_ends = segment_start + np.cumsum([len(piece) for piece in pieces])
+    segments[i:i + 1] = pieces
+
+    return np.concatenate((segment_ends[:i], piece_ends,
+                           segment_ends[i + 1:] + len(sequence)))
 
 
 def insert_elements(genome: List[Tuple[str, str]],
-                    elements: List[Tuple[str, str]], output_dir: str) -> None:
+                    elements: List[Tuple[str, str]], output_dir: str,
+                    seed: Optional[int] = None) -> None:
     """
     Insert transposable elements into genome.
     :param genome: list of chromosome records
     :param elements: transposable elements to be inserted
     :param output_dir: output directory
+    :param seed: seed of the random number generator
     :return:
     """
     nested_elements_count = 0
-    positions: Dict[int, List[Tuple[str, int, int]]] = \
-        {i: [] for i in range(len(genome))}
-
-    for element in elements:
+    segments = [[ch_seq] for (_, ch_seq) in genome]
+    segment_ends = [np.array([len(ch_seq)], dtype=np.int64)
+                    for (_, ch_seq) in genome]
+
+    # Each element is inserted twice, all random values are drawn at once.
+    # Insertion positions are drawn as fractions of chromosome length, since
+    # the length changes with each insertion.
+    rng = np.random.default_rng(seed)
+    insertion_count = 2 * len(elements)
+    chromosomes = rng.integers(0, len(genome), size=insertion_count)
+    position_fractions = rng.random(insertion_count).tolist()
+    tsds = NUCLEOTIDES[rng.integers(0, 4, size=insertion_count * TSD_LENGTH)] \
+        .tobytes().decode("ascii")
+
+    # Positions of elements inserted into each chromosome, arrays are
+    # allocated for all insertions into the chromosome.
+    capacities = np.bincount(chromosomes, minlength=len(genome)).tolist()
+    titles: List[List[str]] = [[] for _ in genome]
+    starts = [np.empty(capacity, dtype=np.int64) for capacity in capacities]
+    ends = [np.empty(capacity, dtype=np.int64) for capacity in capacities]
+
+    for (k, element) in enumerate(elements):
         element_name, element_seq = element
         element_length = len(element_seq)
 
         for j in range(1, 3):
-            chromosome = random.randrange(0, len(genome))
-            ch_title, ch_seq = genome[chromosome]
-            insert_position = random.randrange(0, len(ch_seq))
-            tsd = "".join(
-                random.choice(['A', 'C', 'G', 'T']) for _ in range(3))
+            insertion = 2 * k + j - 1
+            chromosome = int(chromosomes[insertion])
+            ch_length = int(segment_ends[chromosome][-1])
+            insert_position = int(position_fractions[insertion] * ch_length)
+            tsd = tsds[insertion * TSD_LENGTH:(insertion + 1) * TSD_LENGTH]
             element_start = insert_position + len(tsd)
             element_end = element_start + element_length
             insertion_length = element_length + len(tsd) * 2
 
-            genome[chromosome] = (
-                ch_title, (ch_seq[:insert_position] + tsd + element_seq
-                           + tsd + ch_seq[insert_position:]))
+            segment_ends[chromosome] = insert_segment(
+                segments[chromosome], segment_ends[chromosome],
+                insert_position, tsd + element_seq + tsd)
+
+            # Elements after the insertion are shifted, elements spanning
+            # the insertion are extended by it.
+            count = len(titles[chromosome])
+            ch_starts = starts[chromosome][:count]
+            ch_ends = ends[chromosome][:count]
+            affected = ch_ends > insert_position
+            shifted = affected & (ch_starts >= insert_position)
+
+            ch_starts[shifted] += insertion_length
+            ch_ends[affected] += insertion_length
+            nested_elements_count += int(np.count_nonzero(affected
+                                                          & ~shifted))
 
-            ch_positions = positions[chromosome]
-            for i in range(len(ch_positions)):
-                (title, start, end) = ch_positions[i]
+            titles[chromosome].append(f"{element[0]}_{j}_ch{chromosome + 1}")
+            starts[chromosome][count] = element_start
+            ends[chromosome][count] = element_end
 
-                if end <= insert_position:
-                    ch_positions[i] = (title, start, end)
-                elif insert_position <= start:
-                    ch_positions[i] = (title, start + insertion_length,
-                                       end + insertion_length)
-                else:
-                    ch_positions[i] = (title, start, end + insertion_length)
-                    nested_elements_count += 1
+    positions: Dict[int, List[Tuple[str, int, int]]] = {
+        i: list(zip(titles[i], starts[i].tolist(), ends[i].tolist()))
+        for i in range(len(genome))}
 
-            ch_positions.append((f"{element[0]}_{j}_ch{chromosome + 1}",
-                                 element_start, element_end))
+    for (i, (ch_title, _)) in enumerate(genome):
+        genome[i] = (ch_title, "".join(segments[i]))
 
     write_genome(f"{output_dir}/genome_with_insertions.fasta", genome)
     write_inserted_sequences(f"{output_dir}/inserted_elements.fasta",
@@ -134,7 +188,7 @@ def main() -> None:
 
     genome = read_genome(args.genome)
     elements = read_elements(args.elements)
-    insert_elements(genome, elements, args.output_dir)
+    insert_elements(genome, elements, args.output_dir, args.seed)
 
 
 if __name__ == '__main__':
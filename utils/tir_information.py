@@ -1,55 +1,226 @@
-from typing import Tuple
+import functools
+import mmap
+import os
+import string
+from dataclasses import dataclass
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
 
-from Bio import Align  # type: ignore
-from Bio.SeqIO.FastaIO import SimpleFastaParser  # type: ignore
+import numpy as np
 
 from parsing.tir_information import parse_arguments
+from utils.tir_kernel import make_align_batch
 
+# Translation table to complement nucleotide sequence (IUPAC code) and
+# convert it to uppercase at once.
+COMPLEMENTS = dict(zip("ACGTRYKMBVDH", "TGCAYRMKVBHD"))
+COMPLEMENT_TABLE = bytes.maketrans(
+    (string.ascii_uppercase + string.ascii_lowercase).encode(),
+    "".join(COMPLEMENTS.get(base, base) for base
+            in string.ascii_uppercase + string.ascii_uppercase).encode())
+COMPLEMENT_CODES = np.frombuffer(COMPLEMENT_TABLE, dtype=np.uint8)
 
-def extract_tir_info(record: Tuple[str, str], aligner: Align.PairwiseAligner,
+# Lookup table converting byte codes of letters to uppercase. Lookup tables
+# are applied to whole batch of sequence starts and ends at once.
+UPPERCASE_CODES = np.frombuffer(
+    bytes.maketrans(string.ascii_lowercase.encode(),
+                    string.ascii_uppercase.encode()), dtype=np.uint8)
+
+# Records are streamed through alignment in batches and written in binary
+# mode through large buffer.
+BATCH_SIZE = 10000
+WRITE_BUFFER_SIZE = 1 << 22
+
+# Header of output record with TIR information appended to the title.
+TIR_HEADER_TEMPLATE = b">%b_%dbpTIR(m=%d, g=%d)\n"
+
+# Characters removed from sequence lines when they are joined.
+SEQUENCE_DELETE_CHARS = b" \r\n"
+
+# Starts of transposon sequences, reverse complements of their ends (both
+# padded to common length) and numbers of their valid bases
+TirMatrices = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+@dataclass(frozen=True)
+class TirAligner:
+    """
+    Scores of local alignment of TIRs.
+    """
+    match_score: int
+    mismatch_score: int
+    open_gap_score: int
+    extend_gap_score: int
+
+
+def extract_tir_info(record: Tuple[str, str],
+                     aligner: Optional[TirAligner] = None,
                      length: int = 28) -> Tuple[str, str]:
     """
     Retrieve TIR information for trasnposon sequence.
     :param record: tuple with transposon sequence title and sequence
-    :param aligner: pairwise aligner object
+    :param aligner: TIR aligner, shared default aligner is used if None
     :param length: TIR length to be aligned
+    :return: title with TIR information and sequence
     """
     title = record[0]
     sequence = record[1]
 
-    best_alignment = max(aligner.align(str.upper(sequence[0:length]),
-                                       str.upper(sequence[-length:]),
-                                       strand="-"))
+    if aligner is None:
+        aligner = default_aligner()
 
-    gaps, identities, mismatches = best_alignment.counts()
+    identities, mismatches, gaps = align_tirs(
+        tir_matrices([sequence.encode()], length), aligner)[0].tolist()
 
-    new_title = (f"{title}_{gaps + identities + mismatches}"
-                 f"bpTIR(m={mismatches}, g={gaps})")
+    return tir_title(title, identities, mismatches, gaps), sequence
 
-    return new_title, sequence
 
+def iter_fasta(in_file: str) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Read FASTA records from memory mapped file. Records are split at line
+    starts with ">" and their sequence lines are joined at once. Titles and
+    sequences are kept as bytes, so they can be written out without
+    re-encoding.
+    :param in_file: path to FASTA file
+    :return: iterator of tuples with record title and sequence
+    """
+    with open(in_file, "rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            file_size = len(mm)
+
+            # Text before the first header is skipped.
+            if mm[0] == ord(">"):
+                position = 0
+            else:
+                position = mm.find(b"\n>") + 1 or file_size
+
+            while position < file_size:
+                end = mm.find(b"\n>", position) + 1 or file_size
+                title_end = mm.find(b"\n", position, end)
 
-def default_aligner() -> Align.PairwiseAligner:
+                if title_end < 0:
+                    title_end = end
+
+                yield (mm[position + 1:title_end].rstrip(),
+                       mm[title_end:end].translate(
+                           None, SEQUENCE_DELETE_CHARS))
+
+                position = end
+
+
+def tir_title(title: str, identities: int, mismatches: int,
+              gaps: int) -> str:
     """
-    Default aligner with match=2, mismatch=-3, open=-5, extend=-2
+    Append TIR information to transposon sequence title.
+    :param title: transposon sequence title
+    :param identities: number of identities in TIR alignment
+    :param mismatches: number of mismatches in TIR alignment
+    :param gaps: number of gaps in TIR alignment
+    :return: title with TIR length, mismatches and gaps
+    """
+    return (f"{title}_{gaps + identities + mismatches}"
+            f"bpTIR(m={mismatches}, g={gaps})")
+
+
+def tir_matrices(sequences: List[bytes], length: int) -> TirMatrices:
+    """
+    Store starts and reverse complemented ends of transposon sequences in
+    rows of two matrices, so that they can be aligned in one batch.
+    :param sequences: transposon sequences
+    :param length: TIR length to be aligned
+    :return: matrix of starts, matrix of reverse complemented ends and
+    number of valid bases in their rows
+    """
+    lengths = np.minimum(np.fromiter(map(len, sequences), dtype=np.int64,
+                                     count=len(sequences)), length)
+    columns = np.arange(length)
+
+    # Starts fill rows from the left and ends from the right, both are
+    # joined into one buffer and scattered to valid cells at once.
+    heads = np.zeros((len(sequences), length), dtype=np.uint8)
+    heads[columns < lengths[:, np.newaxis]] = np.frombuffer(
+        b"".join([sequence[:length] for sequence in sequences]),
+        dtype=np.uint8)
+    tails = np.zeros((len(sequences), length), dtype=np.uint8)
+    tails[columns >= length - lengths[:, np.newaxis]] = np.frombuffer(
+        b"".join([sequence[-length:] for sequence in sequences]),
+        dtype=np.uint8)
+
+    # Reversing right-aligned ends leaves them left-aligned like starts.
+    np.take(UPPERCASE_CODES, heads, out=heads)
+    tails_rc = COMPLEMENT_CODES[tails[:, ::-1]]
+
+    return heads, tails_rc, lengths
+
+
+def tir_matrices_at(sequence: bytes, starts: np.ndarray, ends: np.ndarray,
+                    length: int = 28) -> TirMatrices:
+    """
+    Gather starts and reverse complemented ends of transposons located in
+    one sequence into rows of two matrices by fancy indexing, without
+    slicing transposon sequences. Transposons must be at least length long.
+    :param sequence: sequence containing transposons
+    :param starts: start positions of transposons
+    :param ends: end positions of transposons (exclusive)
+    :param length: TIR length to be aligned
+    :return: matrix of starts, matrix of reverse complemented ends and
+    number of valid bases in their rows
+    """
+    codes = np.frombuffer(sequence, dtype=np.uint8)
+    columns = np.arange(length)
+
+    heads = UPPERCASE_CODES[codes[starts[:, np.newaxis] + columns]]
+    tails_rc = COMPLEMENT_CODES[codes[ends[:, np.newaxis] - 1 - columns]]
+
+    return heads, tails_rc, np.full(len(starts), length, dtype=np.int64)
+
+
+def align_tirs(matrices: TirMatrices, aligner: TirAligner) -> np.ndarray:
+    """
+    Locally align batch of TIR pairs. Identical pairs, common among members
+    of transposon family, are aligned only once.
+    :param matrices: starts and reverse complemented ends of transposon
+    sequences
+    :param aligner: TIR aligner
+    :return: (N, 3) matrix of identities, mismatches and gaps
+    """
+    heads, tails_rc, lengths = matrices
+    align_batch = make_align_batch(aligner.match_score,
+                                   aligner.mismatch_score,
+                                   aligner.open_gap_score,
+                                   aligner.extend_gap_score)
+
+    # Pairs are compared as single opaque values, which sorts much faster
+    # than unique rows of matrix.
+    pairs = np.hstack((heads, tails_rc, lengths[:, np.newaxis]
+                       .astype(np.uint32).view(np.uint8)))
+    keys = pairs.view(np.dtype((np.void, pairs.shape[1]))).ravel()
+    _, unique, inverse = np.unique(keys, return_index=True,
+                                   return_inverse=True)
+    counts = align_batch(heads[unique], tails_rc[unique], lengths[unique])
+
+    return counts[inverse.reshape(-1)]
+
+
+@functools.lru_cache(maxsize=None)
+def default_aligner() -> TirAligner:
+    """
+    Default aligner with match=2, mismatch=-3, open=-5, extend=-2, created
+    once and shared by all callers
     """
     return init_aligner(2, -3, -5, -2)
 
 
 def init_aligner(match_score: int, mismatch_score: int, open_gap_score: int,
-                 extend_gap_score: int) -> Align.PairwiseAligner:
+                 extend_gap_score: int) -> TirAligner:
     """
     Set alignment scores for the aligner object
     """
-    aligner = Align.PairwiseAligner()
-    aligner.mode = "local"
-
-    aligner.match_score = match_score
-    aligner.mismatch_score = mismatch_score
-    aligner.open_gap_score = open_gap_score
-    aligner.extend_gap_score = extend_gap_score
-
-    return aligner
+    return TirAligner(match_score, mismatch_score, open_gap_score,
+                      extend_gap_score)
 
 
 def main() -> None:
@@ -58,17 +229,23 @@ def main() -> None:
     out_file = args.out_file
     length = args.tir_length
 
-    with open(in_file, "r") as handle:
-        records = list(SimpleFastaParser(handle))
-
     aligner = default_aligner()
 
-    with_tir_info = map(lambda rec: extract_tir_info(rec, aligner, length),
-                        records)
-
-    with open(out_file, "w") as handle:
-        for record in with_tir_info:
-            handle.write(f">{record[0]}\n{record[1]}\n")
+    with open(out_file, "wb", buffering=WRITE_BUFFER_SIZE) as out_handle:
+        records = iter_fasta(in_file)
+
+        for batch in iter(lambda: list(islice(records, BATCH_SIZE)), []):
+            matrices = tir_matrices([record[1] for record in batch], length)
+            counts = align_tirs(matrices, aligner).tolist()
+
+            # Records are written straight to the buffered output without
+            # copying sequences into formatted batch.
+            for (title, sequence), (identities, mismatches, gaps) \
+                    in zip(batch, counts):
+                out_handle.write(TIR_HEADER_TEMPLATE % (
+                    title, identities + mismatches + gaps, mismatches, gaps))
+                out_handle.write(sequence)
+                out_handle.write(b"\n")
 
 
 if __name__ == '__main__':
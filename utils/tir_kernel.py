@@ -0,0 +1,367 @@
+import functools
+from typing import Any, Callable, Tuple
+
+import numpy as np
+
+try:
+    from numba import njit, prange  # type: ignore
+    NUMBA_AVAILABLE = True
+except ImportError:
+    # Without Numba (e.g. under PyPy) batches are aligned by pure Python
+    # kernel align_local_python instead of the compiled ones.
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*_args: Any, **_kwargs: Any) -> Callable[[Any], Any]:
+        return lambda function: function
+
+# Score of DP cells that can not be reached, low enough to never win
+# maximum but far enough from int16 minimum to survive adding penalties.
+UNREACHABLE = -(1 << 14)
+
+# Traceback states - alignment ending with aligned pair of bases, with gap
+# in head (base of tail aligned to gap) and with gap in tail.
+ALIGNED, HEAD_GAP, TAIL_GAP = 0, 1, 2
+
+# Aligner of matrices of TIR starts and reverse complemented ends with
+# numbers of valid bases in their rows, returning matrix of counts.
+BatchAligner = Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]
+
+
+@njit(cache=True, boundscheck=False)
+def align_local(head: np.ndarray, tail_rc: np.ndarray, match_score: int,
+                mismatch_score: int, open_gap_score: int,
+                extend_gap_score: int) -> Tuple[int, int, int]:
+    """
+    Smith-Waterman local alignment with affine gaps (Gotoh) of two short
+    sequences. Gap of length k is scored as open + (k - 1) * extend. Scores
+    are stored as int16, which is enough for sequences up to a few thousand
+    bases.
+
+    Ties between optimal alignments are broken by fixed rules, so that just
+    one of them is counted:
+    - the alignment ends with the aligned pair of the highest score with the
+      lowest position in tail_rc, then the lowest position in head,
+    - the traceback stops as soon as the score of the rest drops to zero,
+      so zero-scoring prefixes are never included,
+    - after an aligned pair, gap in head is preferred to another aligned
+      pair and that to gap in tail,
+    - within gap in head, extending it is preferred to opening it after an
+      aligned pair and that to opening it after gap in tail,
+    - within gap in tail, opening it after gap in head is preferred to
+      opening it after an aligned pair and that to extending it.
+    The counts always belong to one of the optimal alignments, but they may
+    differ from the one Biopython's max(PairwiseAligner.align(...)) picks.
+    :param head: uint8 array of uppercase start of transposon sequence
+    :param tail_rc: uint8 array of uppercase reverse complement of end of
+    transposon sequence
+    :param match_score: score of identical bases
+    :param mismatch_score: score of different bases
+    :param open_gap_score: score of first base of gap
+    :param extend_gap_score: score of every next base of gap
+    :return: number of identities, mismatches and gaps in the best alignment
+    """
+    rows = head.shape[0] + 1
+    cols = tail_rc.shape[0] + 1
+
+    # int16 halves the working set, scores of short TIRs fit easily
+    aligned = np.full((rows, cols), UNREACHABLE, dtype=np.int16)
+    head_gap = np.full((rows, cols), UNREACHABLE, dtype=np.int16)
+    tail_gap = np.full((rows, cols), UNREACHABLE, dtype=np.int16)
+
+    best_score = 0
+    best_row = 0
+    best_col = 0
+
+    # filled column by column, the first maximum found is the end of alignment
+    for j in range(1, cols):
+        for i in range(1, rows):
+            if head[i - 1] == tail_rc[j - 1]:
+                score = match_score
+            else:
+                score = mismatch_score
+
+            previous = max(0, aligned[i - 1, j - 1], head_gap[i - 1, j - 1],
+                           tail_gap[i - 1, j - 1])
+            aligned[i, j] = previous + score
+
+            head_gap[i, j] = max(
+                max(aligned[i, j - 1], tail_gap[i, j - 1]) + open_gap_score,
+                head_gap[i, j - 1] + extend_gap_score)
+            tail_gap[i, j] = max(
+                max(aligned[i - 1, j], head_gap[i - 1, j]) + open_gap_score,
+                tail_gap[i - 1, j] + extend_gap_score)
+
+            if aligned[i, j] > best_score:
+                best_score = aligned[i, j]
+                best_row = i
+                best_col = j
+
+    identities = 0
+    mismatches = 0
+    gaps = 0
+
+    if best_score == 0:
+        return identities, mismatches, gaps
+
+    i = best_row
+    j = best_col
+    state = ALIGNED
+
+    while True:
+        if state == ALIGNED:
+            # counters and score of the pair are updated without branching
+            mismatch = int(head[i - 1] != tail_rc[j - 1])
+            identities += 1 - mismatch
+            mismatches += mismatch
+            previous = (aligned[i, j] - match_score
+                        - mismatch * (mismatch_score - match_score))
+            i -= 1
+            j -= 1
+
+            if previous == 0:
+                break
+            if head_gap[i, j] == previous:
+                state = HEAD_GAP
+            elif aligned[i, j] == previous:
+                state = ALIGNED
+            else:
+                state = TAIL_GAP
+        elif state == HEAD_GAP:
+            gaps += 1
+            current = head_gap[i, j]
+            j -= 1
+
+            if head_gap[i, j] + extend_gap_score == current:
+                state = HEAD_GAP
+            elif aligned[i, j] + open_gap_score == current:
+                state = ALIGNED
+            else:
+                state = TAIL_GAP
+        else:
+            gaps += 1
+            current = tail_gap[i, j]
+            i -= 1
+
+            if head_gap[i, j] + open_gap_score == current:
+                state = HEAD_GAP
+            elif aligned[i, j] + open_gap_score == current:
+                state = ALIGNED
+            else:
+                state = TAIL_GAP
+
+    return identities, mismatches, gaps
+
+
+def align_local_python(head: bytes, tail_rc: bytes, match_score: int,
+                       mismatch_score: int, open_gap_score: int,
+                       extend_gap_score: int) -> Tuple[int, int, int]:
+    """
+    Pure Python version of align_local working on bytes and lists of ints,
+    with the same scores and tie-break rules. DP matrices are stored as
+    lists of columns.
+    :param head: uppercase start of transposon sequence
+    :param tail_rc: uppercase reverse complement of end of transposon
+    sequence
+    :param match_score: score of identical bases
+    :param mismatch_score: score of different bases
+    :param open_gap_score: score of first base of gap
+    :param extend_gap_score: score of every next base of gap
+    :return: number of identities, mismatches and gaps in the best alignment
+    """
+    unreachable = [UNREACHABLE] * (len(head) + 1)
+    aligned = [unreachable]
+    head_gap = [unreachable]
+    tail_gap = [unreachable]
+
+    best_score = 0
+    best_row = 0
+    best_col = 0
+
+    # filled column by column, the first maximum found is the end of alignment
+    for j, base in enumerate(tail_rc, 1):
+        left_aligned = aligned[-1]
+        left_head_gap = head_gap[-1]
+        left_tail_gap = tail_gap[-1]
+        column_aligned = [UNREACHABLE]
+        column_head_gap = [UNREACHABLE]
+        column_tail_gap = [UNREACHABLE]
+        up_aligned = up_head_gap = up_tail_gap = UNREACHABLE
+
+        # cells of the previous column on the diagonal and on the left
+        cells = zip(head, left_aligned, left_head_gap, left_tail_gap,
+                    left_aligned[1:], left_head_gap[1:], left_tail_gap[1:])
+
+        for i, (code, diagonal_aligned, diagonal_head_gap, diagonal_tail_gap,
+                row_aligned, row_head_gap, row_tail_gap) in enumerate(cells,
+                                                                      1):
+            previous = diagonal_aligned
+            if diagonal_head_gap > previous:
+                previous = diagonal_head_gap
+            if diagonal_tail_gap > previous:
+                previous = diagonal_tail_gap
+            if previous < 0:
+                previous = 0
+
+            if code == base:
+                current_aligned = previous + match_score
+            else:
+                current_aligned = previous + mismatch_score
+
+            current_head_gap = row_head_gap + extend_gap_score
+            if row_aligned + open_gap_score > current_head_gap:
+                current_head_gap = row_aligned + open_gap_score
+            if row_tail_gap + open_gap_score > current_head_gap:
+                current_head_gap = row_tail_gap + open_gap_score
+
+            current_tail_gap = up_tail_gap + extend_gap_score
+            if up_aligned + open_gap_score > current_tail_gap:
+                current_tail_gap = up_aligned + open_gap_score
+            if up_head_gap + open_gap_score > current_tail_gap:
+                current_tail_gap = up_head_gap + open_gap_score
+
+            column_aligned.append(current_aligned)
+            column_head_gap.append(current_head_gap)
+            column_tail_gap.append(current_tail_gap)
+            up_aligned = current_aligned
+            up_head_gap = current_head_gap
+            up_tail_gap = current_tail_gap
+
+            if current_aligned > best_score:
+                best_score = current_aligned
+                best_row = i
+                best_col = j
+
+        aligned.append(column_aligned)
+        head_gap.append(column_head_gap)
+        tail_gap.append(column_tail_gap)
+
+    identities = 0
+    mismatches = 0
+    gaps = 0
+
+    if best_score == 0:
+        return identities, mismatches, gaps
+
+    i = best_row
+    j = best_col
+    state = ALIGNED
+
+    while True:
+        if state == ALIGNED:
+            if head[i - 1] == tail_rc[j - 1]:
+                identities += 1
+                previous = aligned[j][i] - match_score
+            else:
+                mismatches += 1
+                previous = aligned[j][i] - mismatch_score
+            i -= 1
+            j -= 1
+
+            if previous == 0:
+                break
+            if head_gap[j][i] == previous:
+                state = HEAD_GAP
+            elif aligned[j][i] == previous:
+                state = ALIGNED
+            else:
+                state = TAIL_GAP
+        elif state == HEAD_GAP:
+            gaps += 1
+            current = head_gap[j][i]
+            j -= 1
+
+            if head_gap[j][i] + extend_gap_score == current:
+                state = HEAD_GAP
+            elif aligned[j][i] + open_gap_score == current:
+                state = ALIGNED
+            else:
+                state = TAIL_GAP
+        else:
+            gaps += 1
+            current = tail_gap[j][i]
+            i -= 1
+
+            if head_gap[j][i] + open_gap_score == current:
+                state = HEAD_GAP
+            elif aligned[j][i] + open_gap_score == current:
+                state = ALIGNED
+            else:
+                state = TAIL_GAP
+
+    return identities, mismatches, gaps
+
+
+def align_batch_python(heads: np.ndarray, tails_rc: np.ndarray,
+                       lengths: np.ndarray, match_score: int,
+                       mismatch_score: int, open_gap_score: int,
+                       extend_gap_score: int) -> np.ndarray:
+    """
+    Locally align batch of TIR pairs stored in rows of two matrices one by
+    one with pure Python kernel.
+    :param heads: (N, L) uint8 matrix of starts of transposon sequences
+    :param tails_rc: (N, L) uint8 matrix of reverse complements of ends of
+    transposon sequences
+    :param lengths: number of valid bases in every row of both matrices
+    :param match_score: score of identical bases
+    :param mismatch_score: score of different bases
+    :param open_gap_score: score of first base of gap
+    :param extend_gap_score: score of every next base of gap
+    :return: (N, 3) matrix of identities, mismatches and gaps
+    """
+    counts = [align_local_python(head[:length], tail_rc[:length],
+                                 match_score, mismatch_score,
+                                 open_gap_score, extend_gap_score)
+              for head, tail_rc, length
+              in zip(map(bytes, heads), map(bytes, tails_rc),
+                     lengths.tolist())]
+
+    return np.array(counts, dtype=np.int32).reshape(-1, 3)
+
+
+@functools.lru_cache(maxsize=None)
+def make_align_batch(match_score: int, mismatch_score: int,
+                     open_gap_score: int,
+                     extend_gap_score: int) -> BatchAligner:
+    """
+    Compile batch aligner specialized for given scores. Scores are captured
+    as compile-time constants, so they are folded into the DP recurrence.
+    Aligners are cached for every combination of scores. Without Numba, pure
+    Python batch aligner with the scores bound is returned.
+    :param match_score: score of identical bases
+    :param mismatch_score: score of different bases
+    :param open_gap_score: score of first base of gap
+    :param extend_gap_score: score of every next base of gap
+    :return: batch aligner
+    """
+    if not NUMBA_AVAILABLE:
+        return functools.partial(align_batch_python,
+                                 match_score=match_score,
+                                 mismatch_score=mismatch_score,
+                                 open_gap_score=open_gap_score,
+                                 extend_gap_score=extend_gap_score)
+
+    @njit(cache=True, boundscheck=False, parallel=True)
+    def align_batch(heads: np.ndarray, tails_rc: np.ndarray,
+                    lengths: np.ndarray) -> np.ndarray:
+        """
+        Locally align batch of TIR pairs stored in rows of two matrices.
+        Rows are independent and aligned in parallel by Numba threads when
+        available.
+        :param heads: (N, L) uint8 matrix of starts of transposon sequences
+        :param tails_rc: (N, L) uint8 matrix of reverse complements of ends
+        of transposon sequences
+        :param lengths: number of valid bases in every row of both matrices
+        :return: (N, 3) matrix of identities, mismatches and gaps
+        """
+        counts = np.zeros((heads.shape[0], 3), dtype=np.int32)
+
+        for k in prange(heads.shape[0]):
+            counts[k, 0], counts[k, 1], counts[k, 2] = align_local(
+                heads[k, :lengths[k]], tails_rc[k, :lengths[k]],
+                match_score, mismatch_score, open_gap_score,
+                extend_gap_score)
+
+        return counts
+
+    return align_batch